@@ -1,52 +1,19 @@
-def generate_urls(years=None, months=None, regions=None):
-    """
-    Generate URLs for Citibike data based on years, months, and regions.
-    
-    Examples:
-    - generate_urls(years=[2023]) -> All data for 2023 (yearly file)
-    - generate_urls(years=[2023], months=[1,2,3]) -> Jan, Feb, Mar 2023 monthly files
-    - generate_urls(years=[2023], regions=['JC']) -> Jersey City data for 2023
-    """
-    if not years:
-        # Default to current year and previous year if not specified
-        current_year = datetime.now().year
-        years = [current_year, current_year - 1]
-    
-    if not regions:
-        # Default to NYC (empty prefix) and Jersey City (JC-)
-        regions = ['', 'JC-']
-    
-    urls = []
-    
-    # Generate URLs based on the parameters
-    for year in years:
-        # If months are specified, generate monthly URLs
-        if months:
-            for month in months:
-                for region in regions:
-                    # Format: <region>YYYYMM-citibike-tripdata.csv.zip or <region>YYYYMM-citibike-tripdata.zip
-                    # Examples: 202301-citibike-tripdata.csv.zip or JC-202301-citibike-tripdata.csv.zip
-                    filename = f"{region}{year}{month:02d}-citibike-tripdata"
-                    
-                    # Try both .csv.zip and .zip extensions
-                    urls.append(f"{BASE_URL}{filename}.csv.zip")
-                    urls.append(f"{BASE_URL}{filename}.zip")
-        else:
-            # Generate yearly file URLs if no months specified
-            for region in regions:
-                if region == '':  # NYC has yearly datasets
-                    filename = f"{year}-citibike-tripdata.zip"
-                    urls.append(f"{BASE_URL}{filename}")
-    
-    return urls
-
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import copy
+import functools
+import gc
 import json
-import urllib.request
+import urllib3
+from urllib3.util.retry import Retry
 import zipfile
-from io import BytesIO
-import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from s3_range_reader import open_s3_object
+from zip_member_filter import is_selected_csv_member
 
 # Configuration
 SOURCE_BUCKET = 'citibike-trips-data-1'
@@ -56,20 +23,70 @@ PROCESSED_DATA_PREFIX = 'processed_data/'
 RESULT_FILES_PREFIX = 'result_files/'
 ARCHIVE_PREFIX = 'archive/'
 BASE_URL = 'https://s3.amazonaws.com/tripdata/'
+# Number of URLs processed concurrently (match to the Lambda's vCPU allocation)
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '2'))
+# Multipart settings used when streaming downloads straight into S3
+TRANSFER_CONFIG = TransferConfig(
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+# Large files are fetched as parallel HTTP byte ranges, one S3 multipart part per range.
+# Every part but the last must be at least 5 MiB, so smaller settings are raised to that.
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+RANGE_CHUNK_SIZE = max(S3_MIN_PART_SIZE, int(os.environ.get('RANGE_CHUNK_SIZE', str(64 * 1024 * 1024))))
+RANGE_WORKERS = int(os.environ.get('RANGE_WORKERS', '4'))
+# The CSV -> Parquet step runs in its own Lambda ('Event' = async, 'RequestResponse' = wait)
+PROCESSOR_FUNCTION_NAME = os.environ.get('PROCESSOR_FUNCTION_NAME', 'process_citibike_data_lambda')
+PROCESSOR_INVOCATION_TYPE = os.environ.get('PROCESSOR_INVOCATION_TYPE', 'Event')
+# Number of CSV files handed to each processor invocation
+PROCESSOR_BATCH_SIZE = int(os.environ.get('PROCESSOR_BATCH_SIZE', '4'))
+# Concurrent HEAD requests used to drop candidate URLs that don't exist
+URL_CHECK_WORKERS = int(os.environ.get('URL_CHECK_WORKERS', '32'))
+# Pooled HTTP connections to the tripdata host are reused across requests (keep-alive).
+# The pool holds one connection per concurrent request (the URL checks, or every URL
+# worker's ranged GETs) so none are opened and then discarded as surplus.
+# Connection errors and 5xx responses are retried with exponential backoff.
+HTTP = urllib3.PoolManager(
+    maxsize=max(URL_CHECK_WORKERS, MAX_WORKERS * RANGE_WORKERS),
+    block=False,
+    retries=Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['HEAD', 'GET']),
+        raise_on_status=False
+    )
+)
+# URLs found by earlier warm invocations skip the availability check. Only existence is
+# remembered: files get republished under the same name with a different size.
+KNOWN_AVAILABLE_URLS = set()
+# Concurrent listings of result_files/ shards when reprocessing existing files
+LIST_WORKERS = int(os.environ.get('LIST_WORKERS', '8'))
+# Zip members are extracted and uploaded in parallel, reading the zip with ranged GETs
+UNZIP_WORKERS = int(os.environ.get('UNZIP_WORKERS', '4'))
+
+# AWS clients are created once per container and reused across warm invocations.
+# Adaptive retries absorb transient throttling/5xx errors instead of failing the URL.
+# The connection pool is sized for the parallel per-member and per-part uploads.
+BOTO_CONFIG = Config(retries={'max_attempts': 10, 'mode': 'adaptive'}, max_pool_connections=32)
+S3_CLIENT = boto3.client('s3', config=BOTO_CONFIG)
+GLUE_CLIENT = boto3.client('glue', config=BOTO_CONFIG)
+SQS_CLIENT = boto3.client('sqs', config=BOTO_CONFIG)
+LAMBDA_CLIENT = boto3.client('lambda', config=BOTO_CONFIG)
 
 def lambda_handler(event, context):
     """
     Main orchestrator Lambda function that coordinates the Citibike ETL process:
     1. Downloads Citibike zip files based on provided URLs
-    2. Unzips the files and stores them in S3
-    3. Processes the CSV files, updates the schema, and stores as Parquet
-    4. Triggers AWS Glue crawler to update the data catalog
-    5. Performs cleanup by moving or deleting the original zip files
+    2. With stage_csv, unzips the files to result_files/ in S3
+    3. Performs cleanup by moving the original zip files to the archive location
+    4. Invokes process_citibike_data_lambda, which converts the CSV files (read straight
+       from the archived zip unless staged) to Parquet and updates the schema
+    5. Triggers AWS Glue crawler to update the data catalog. With asynchronous
+       processing the Parquet files don't exist yet, so each processor invocation
+       starts the crawler once it has written its files instead.
     """
-    # Initialize clients
-    s3_client = boto3.client('s3')
-    glue_client = boto3.client('glue')
-    
     # Extract parameters from the event or use defaults
     urls = event.get('urls', [])
     filenames = event.get('filenames', [])
@@ -78,6 +95,9 @@ def lambda_handler(event, context):
     regions = event.get('regions', [])  # NYC is default (empty), JC for Jersey City
     trigger_crawler = event.get('trigger_crawler', True)
     crawler_name = event.get('crawler_name', 'citibike-data-crawler')
+    crawler_event_queue_arn = event.get('crawler_event_queue_arn')  # Enables incremental crawling
+    stage_csv = event.get('stage_csv', False)  # Keep the intermediate result_files/ CSV copies
+    zip_members = event.get('zip_members')  # Only extract these files (name or basename) from each zip
     
     # Generate URLs based on years/months/regions if provided
     if not urls and (years or months):
@@ -87,92 +107,234 @@ def lambda_handler(event, context):
     if not urls and filenames:
         urls = [f"{BASE_URL}{filename}" for filename in filenames]
     
+    # If no URLs are provided, check if we're processing existing files
+    process_existing = event.get('process_existing', False)
+    if not urls and not process_existing:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('No Citibike data URLs provided and process_existing is false')
+        }
+    
+    # Reconfigure the crawler to only crawl newly created objects if requested
+    crawler_config_status = None
+    if crawler_event_queue_arn:
+        crawler_config_status = configure_crawler_event_mode(GLUE_CLIENT, crawler_name, crawler_event_queue_arn)
+    
     if not urls:
-        # If no URLs are provided, check if we're processing existing files
-        process_existing = event.get('process_existing', False)
-        if process_existing:
-            return process_existing_files(s3_client, glue_client, crawler_name, trigger_crawler)
-        else:
-            return {
-                'statusCode': 400,
-                'body': json.dumps('No Citibike data URLs provided and process_existing is false')
-            }
+        return process_existing_files(S3_CLIENT, GLUE_CLIENT, crawler_name, trigger_crawler, crawler_config_status)
+    
+    # Generated URLs include both .csv.zip and .zip variants, so skip the ones that don't exist
+    available_urls = filter_available_urls(urls)
+    skipped_urls = [url for url in urls if url not in available_urls]
+    urls = list(available_urls)
     
+    # Each URL is independent, so run the download (and unzip) steps concurrently
     results = []
-    for url in urls:
-        try:
-            # Step 1: Download file
-            file_result = download_citibike_file(url)
-            
-            # Step 2: Unzip file
-            if file_result['success']:
-                unzip_result = unzip_citibike_file(file_result['zip_key'])
-                
-                # Step 3: Process the CSV files
-                if unzip_result['success']:
-                    process_result = process_citibike_files(unzip_result['csv_keys'])
-                    
-                    # Step 4: Clean up by moving the zip file to archive
-                    cleanup_result = cleanup_files(file_result['zip_key'])
-                    
-                    results.append({
-                        'url': url,
-                        'download': file_result,
-                        'unzip': unzip_result,
-                        'process': process_result,
-                        'cleanup': cleanup_result
-                    })
-                else:
-                    results.append({
-                        'url': url,
-                        'download': file_result,
-                        'unzip': unzip_result,
-                        'error': 'Failed to unzip file'
-                    })
-            else:
-                results.append({
-                    'url': url,
-                    'download': file_result,
-                    'error': 'Failed to download file'
-                })
-        except Exception as e:
-            results.append({
-                'url': url,
-                'error': str(e)
-            })
+    with ThreadPoolExecutor(max_workers=max(1, min(len(urls), MAX_WORKERS))) as executor:
+        futures = {executor.submit(_process_one, url, stage_csv, zip_members, available_urls[url]): url for url in urls}
+        for future in as_completed(futures):
+            results.append(future.result())
+    
+    # Clean up all downloaded zip files together so the deletes can be batched
+    zip_keys = [result['download']['zip_key'] for result in results if 'error' not in result]
+    cleanup_status = cleanup_files_batch(zip_keys) if zip_keys else None
+    archive_locations = cleanup_status['archive_locations'] if cleanup_status else {}
+    
+    # Hand the data off to the processor Lambda. This happens after cleanup so an
+    # asynchronous processor never reads a zip that is being moved to the archive.
+    processor_crawler_name = get_processor_crawler_name(trigger_crawler, crawler_name)
+    for result in results:
+        if 'error' in result:
+            continue
+        
+        if 'unzip' in result:
+            result['process'] = process_citibike_files(result['unzip']['csv_keys'], processor_crawler_name)
+        else:
+            zip_key = result['download']['zip_key']
+            result['process'] = process_citibike_zip(
+                archive_locations.get(zip_key, zip_key), zip_members, processor_crawler_name
+            )
     
-    # Step 4: Trigger Glue crawler if requested
+    # Step 5: Trigger Glue crawler if requested
     crawler_status = None
     if trigger_crawler:
-        crawler_status = trigger_glue_crawler(glue_client, crawler_name)
+        crawler_status = trigger_crawler_after_processing(GLUE_CLIENT, crawler_name)
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Processed {len(urls)} Citibike data URLs',
             'results': results,
+            'skipped_urls': skipped_urls,
+            'cleanup': cleanup_status,
+            'crawler_config': crawler_config_status,
             'crawler': crawler_status
         })
     }
 
-def download_citibike_file(url):
-    """Download a Citibike zip file from a URL and upload to S3."""
-    s3_client = boto3.client('s3')
+def generate_urls(years=None, months=None, regions=None):
+    """
+    Generate URLs for Citibike data based on years, months, and regions.
+    
+    Examples:
+    - generate_urls(years=[2023]) -> All data for 2023 (yearly file)
+    - generate_urls(years=[2023], months=[1,2,3]) -> Jan, Feb, Mar 2023 monthly files
+    - generate_urls(years=[2023], regions=['JC']) -> Jersey City data for 2023
+    """
+    if not years:
+        # Default to current year and previous year if not specified
+        current_year = datetime.now().year
+        years = [current_year, current_year - 1]
+    
+    if not regions:
+        # Default to NYC (empty prefix) and Jersey City (JC-)
+        regions = ['', 'JC-']
+    
+    # The URL list is deterministic for its inputs, so it is cached per warm container
+    return list(_generate_urls(tuple(years), tuple(months or ()), tuple(regions)))
+
+@functools.lru_cache(maxsize=None)
+def _generate_urls(years, months, regions):
+    """Build the URL list for generate_urls; arguments are tuples so results can be cached."""
+    urls = []
+    
+    # Generate URLs based on the parameters
+    for year in years:
+        # If months are specified, generate monthly URLs
+        if months:
+            for month in months:
+                for region in regions:
+                    # Format: <region>YYYYMM-citibike-tripdata.csv.zip or <region>YYYYMM-citibike-tripdata.zip
+                    # Examples: 202301-citibike-tripdata.csv.zip or JC-202301-citibike-tripdata.csv.zip
+                    filename = f"{region}{year}{month:02d}-citibike-tripdata"
+                    
+                    # Try both .csv.zip and .zip extensions
+                    urls.append(f"{BASE_URL}{filename}.csv.zip")
+                    urls.append(f"{BASE_URL}{filename}.zip")
+        else:
+            # Generate yearly file URLs if no months specified
+            for region in regions:
+                if region == '':  # NYC has yearly datasets
+                    filename = f"{year}-citibike-tripdata.zip"
+                    urls.append(f"{BASE_URL}{filename}")
+    
+    return tuple(urls)
+
+def check_url(url):
+    """
+    Check with a HEAD request whether a URL exists, without downloading it.
+    
+    Returns (exists, ranged content length). The length is None when it is unknown
+    (no byte range support, or the URL was found by an earlier invocation), and the
+    download step then sends its own HEAD request.
+    """
+    if url in KNOWN_AVAILABLE_URLS:
+        return True, None
+    
+    try:
+        response = HTTP.request('HEAD', url)
+    except urllib3.exceptions.HTTPError:
+        # Let the download step report connection problems
+        return True, None
+    
+    # Missing objects come back as 404 (or 403 from buckets without public listing)
+    if response.status in (403, 404):
+        return False, None
+    
+    if response.status < 400:
+        KNOWN_AVAILABLE_URLS.add(url)
+    return True, ranged_content_length(response)
+
+def filter_available_urls(urls):
+    """
+    Return {url: ranged content length} for the URLs that exist, preserving order,
+    checking them concurrently. The lengths are only valid for this invocation.
+    """
+    if not urls:
+        return {}
     
+    with ThreadPoolExecutor(max_workers=min(len(urls), URL_CHECK_WORKERS)) as executor:
+        checks = list(executor.map(check_url, urls))
+    
+    return {
+        url: content_length
+        for url, (url_found, content_length) in zip(urls, checks)
+        if url_found
+    }
+
+def _process_one(url, stage_csv=False, zip_members=None, content_length=None):
+    """Run the download step, and the unzip step for staged runs, for a single URL."""
+    try:
+        # Step 1: Download file (reusing the size from this invocation's HEAD check)
+        file_result = download_citibike_file(url, content_length)
+        
+        if not file_result['success']:
+            return {
+                'url': url,
+                'download': file_result,
+                'error': 'Failed to download file'
+            }
+        
+        # Without staging, the processor converts the CSV files straight from the zip
+        if not stage_csv:
+            return {
+                'url': url,
+                'download': file_result
+            }
+        
+        # Step 2 (staged): Unzip file
+        unzip_result = unzip_citibike_file(file_result['zip_key'], zip_members)
+        
+        if unzip_result['success']:
+            return {
+                'url': url,
+                'download': file_result,
+                'unzip': unzip_result
+            }
+        else:
+            return {
+                'url': url,
+                'download': file_result,
+                'unzip': unzip_result,
+                'error': 'Failed to unzip file'
+            }
+    except Exception as e:
+        return {
+            'url': url,
+            'error': str(e)
+        }
+    finally:
+        # Release this URL's transfer buffers before the worker picks up the next one
+        gc.collect()
+
+def download_citibike_file(url, content_length=None):
+    """
+    Download a Citibike zip file from a URL and upload to S3.
+    
+    content_length is the ranged size from a HEAD request sent earlier in the same
+    invocation; without it the file is checked with a fresh HEAD request.
+    """
     # Extract filename from URL
     filename = url.split('/')[-1]
-    local_path = f"/tmp/{filename}"
     
     try:
-        # Download file
-        urllib.request.urlretrieve(url, local_path)
-        
-        # Upload to S3
+        # Stream the HTTP response straight into a multipart S3 upload so the
+        # zip never touches /tmp and parts are uploaded while still downloading
         s3_key = filename
-        s3_client.upload_file(local_path, SOURCE_BUCKET, s3_key)
+        if content_length is None:
+            content_length = get_ranged_content_length(url)
         
-        # Remove local file to free up space
-        os.remove(local_path)
+        if content_length and content_length > RANGE_CHUNK_SIZE:
+            # Large file: fetch byte ranges in parallel instead of a single stream
+            ranged_download_to_s3(S3_CLIENT, url, s3_key, content_length)
+        else:
+            response = HTTP.request('GET', url, preload_content=False)
+            try:
+                if response.status != 200:
+                    raise RuntimeError(f'Failed to download {url} (status {response.status})')
+                S3_CLIENT.upload_fileobj(response, SOURCE_BUCKET, s3_key, Config=TRANSFER_CONFIG)
+            finally:
+                response.release_conn()
         
         return {
             'success': True,
@@ -186,39 +348,96 @@ def download_citibike_file(url):
             'message': f'Failed to download or upload {filename}'
         }
 
-def unzip_citibike_file(zip_key):
-    """Unzip a Citibike zip file in S3 and store the contents."""
-    s3_client = boto3.client('s3')
-    s3_resource = boto3.resource('s3')
+def get_ranged_content_length(url):
+    """Return the size of the remote file if the server supports byte ranges, otherwise None."""
+    return ranged_content_length(HTTP.request('HEAD', url))
+
+def ranged_content_length(response):
+    """Return the file size from a HEAD response if byte ranges are supported, otherwise None."""
+    if response.status != 200 or response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    
+    content_length = response.headers.get('Content-Length')
+    return int(content_length) if content_length else None
+
+def ranged_download_to_s3(s3_client, url, s3_key, content_length):
+    """Download a file as parallel byte ranges, uploading each range as an S3 multipart part."""
+    upload_id = s3_client.create_multipart_upload(Bucket=SOURCE_BUCKET, Key=s3_key)['UploadId']
     
+    def upload_range(part_number, start, end):
+        response = HTTP.request('GET', url, headers={'Range': f'bytes={start}-{end}'})
+        if response.status != 206:
+            raise RuntimeError(f'Server ignored range request for {url} (status {response.status})')
+        data = response.data
+        
+        part = s3_client.upload_part(
+            Bucket=SOURCE_BUCKET,
+            Key=s3_key,
+            PartNumber=part_number,
+            UploadId=upload_id,
+            Body=data
+        )
+        return {'PartNumber': part_number, 'ETag': part['ETag']}
+    
+    # Every part except the last must be at least 5 MiB, which RANGE_CHUNK_SIZE is clamped to
+    ranges = [
+        (part_number, start, min(start + RANGE_CHUNK_SIZE, content_length) - 1)
+        for part_number, start in enumerate(range(0, content_length, RANGE_CHUNK_SIZE), start=1)
+    ]
+    
+    try:
+        with ThreadPoolExecutor(max_workers=RANGE_WORKERS) as executor:
+            parts = list(executor.map(lambda r: upload_range(*r), ranges))
+        
+        s3_client.complete_multipart_upload(
+            Bucket=SOURCE_BUCKET,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        # Don't leave orphaned parts behind (they are billed until aborted)
+        s3_client.abort_multipart_upload(Bucket=SOURCE_BUCKET, Key=s3_key, UploadId=upload_id)
+        raise
+
+def unzip_citibike_file(zip_key, zip_members=None):
+    """Unzip a Citibike zip file in S3 and store the contents (optionally only zip_members)."""
     try:
-        # Get the zip file from S3
-        zip_obj = s3_resource.Object(bucket_name=SOURCE_BUCKET, key=zip_key)
-        buffer = BytesIO(zip_obj.get()["Body"].read())
+        # Read the zip in place on S3: zipfile only needs the central directory
+        # plus the bytes of each member, so the archive is never fully buffered
+        z = zipfile.ZipFile(open_s3_object(S3_CLIENT, SOURCE_BUCKET, zip_key))
         
-        # Create a zipfile object
-        z = zipfile.ZipFile(buffer)
+        def extract_member(filename, destination_key):
+            # ZipFile shares one file position across members, so give each
+            # worker its own reader rather than seeking a shared one
+            with zipfile.ZipFile(open_s3_object(S3_CLIENT, SOURCE_BUCKET, zip_key)) as member_zip:
+                with member_zip.open(filename) as member:
+                    S3_CLIENT.upload_fileobj(
+                        member,
+                        Bucket=SOURCE_BUCKET,
+                        Key=destination_key
+                    )
+            return destination_key
         
-        csv_keys = []
+        futures = []
+        
+        # Include the original zip name in the path to prevent naming conflicts
+        zip_basename = os.path.basename(zip_key).replace('.zip', '')
         
         # Extract each file
-        for filename in z.namelist():
-            # Only process CSV files
-            # Citibike files could be .csv or other extensions like .xlsx
-            if filename.lower().endswith(('.csv', '.xlsx', '.xls')):
-                # Create destination key in the result_files/ prefix
-                # Include the original zip name in the path to prevent naming conflicts
-                zip_basename = os.path.basename(zip_key).replace('.zip', '')
-                destination_key = f"{RESULT_FILES_PREFIX}{zip_basename}/{filename}"
-                
-                # Upload the file to S3
-                s3_resource.meta.client.upload_fileobj(
-                    z.open(filename),
-                    Bucket=SOURCE_BUCKET,
-                    Key=destination_key
-                )
-                
-                csv_keys.append(destination_key)
+        with ThreadPoolExecutor(max_workers=UNZIP_WORKERS) as executor:
+            for filename in z.namelist():
+                # Only process CSV files
+                if is_selected_csv_member(filename, zip_members):
+                    # Create destination key in the result_files/ prefix
+                    destination_key = f"{RESULT_FILES_PREFIX}{zip_basename}/{filename}"
+                    
+                    # Upload the file to S3
+                    futures.append(executor.submit(extract_member, filename, destination_key))
+            
+            csv_keys = [future.result() for future in futures]
+        
+        z.close()
         
         return {
             'success': True,
@@ -232,83 +451,190 @@ def unzip_citibike_file(zip_key):
             'message': f'Failed to unzip {zip_key}'
         }
 
-def process_citibike_files(csv_keys):
-    """Process the extracted CSV files to update the schema and convert to Parquet."""
-    # This function creates an event to pass to the process_citibike_data_lambda function
-    # We'll simulate calling it directly here
+def invoke_processor(event, description):
+    """
+    Invoke the process_citibike_data_lambda function through the Lambda API.
+    
+    By default the invocation is asynchronous ('Event'), so the orchestrator returns
+    as soon as the work is queued and each batch is processed in its own container.
+    """
+    response = LAMBDA_CLIENT.invoke(
+        FunctionName=PROCESSOR_FUNCTION_NAME,
+        InvocationType=PROCESSOR_INVOCATION_TYPE,
+        Payload=json.dumps(event)
+    )
+    
+    if response.get('FunctionError'):
+        raise RuntimeError(response['Payload'].read().decode('utf-8'))
+    
+    if PROCESSOR_INVOCATION_TYPE == 'RequestResponse':
+        body = json.loads(json.loads(response['Payload'].read())['body'])
+        return {
+            'success': True,
+            'processed_files': body['processed_files'],
+            'message': body['message']
+        }
+    
+    return {
+        'success': True,
+        'message': f'Queued {description} for processing by {PROCESSOR_FUNCTION_NAME}'
+    }
+
+def invoke_processor_batches(events, crawler_name=None):
+    """
+    Invoke the processor once per (event, description) batch and combine the results.
+    
+    With crawler_name, each processor invocation starts that crawler after writing its files.
+    """
+    if crawler_name:
+        for event, _ in events:
+            event['crawler_name'] = crawler_name
+    
+    batch_results = [invoke_processor(event, description) for event, description in events]
+    
+    result = {
+        'success': all(batch_result['success'] for batch_result in batch_results),
+        'message': f'Sent {len(batch_results)} batches to {PROCESSOR_FUNCTION_NAME}',
+        'batches': batch_results
+    }
+    
+    # Synchronous invocations report what was processed
+    if any('processed_files' in batch_result for batch_result in batch_results):
+        result['processed_files'] = [
+            processed_file
+            for batch_result in batch_results
+            for processed_file in batch_result.get('processed_files', [])
+        ]
     
-    # Import the process_citibike_data_lambda module's handler function
-    # In a real Lambda environment, you'd use AWS Lambda SDK to invoke another function
+    return result
+
+def process_citibike_files(csv_keys, crawler_name=None):
+    """Process the extracted CSV files to update the schema and convert to Parquet."""
     try:
-        import process_citibike_data_lambda
+        # Split the files into small batches so each processor invocation keeps
+        # a bounded working set and the batches run in parallel containers
+        events = [
+            ({'files_to_process': csv_keys[i:i + PROCESSOR_BATCH_SIZE]},
+             f'{len(csv_keys[i:i + PROCESSOR_BATCH_SIZE])} CSV files')
+            for i in range(0, len(csv_keys), PROCESSOR_BATCH_SIZE)
+        ]
         
-        # Create an event with the files to process
-        event = {
-            'files_to_process': csv_keys
+        return invoke_processor_batches(events, crawler_name)
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to process CSV files'
         }
+
+def process_citibike_zip(zip_key, zip_members=None, crawler_name=None):
+    """Convert the CSV files (optionally only zip_members) inside a Citibike zip in S3 directly to Parquet."""
+    try:
+        # Only the zip's central directory is read here, to split its CSV members into batches
+        with zipfile.ZipFile(open_s3_object(S3_CLIENT, SOURCE_BUCKET, zip_key)) as z:
+            members = [
+                filename for filename in z.namelist()
+                if is_selected_csv_member(filename, zip_members)
+            ]
         
-        # Process the files
-        result = process_citibike_data_lambda.lambda_handler(event, None)
+        # The processor reads the CSV members straight out of the zip, so no
+        # intermediate copies are written to the result_files/ prefix
+        events = [
+            ({'zip_files_to_process': [zip_key], 'zip_members': members[i:i + PROCESSOR_BATCH_SIZE]},
+             f'{len(members[i:i + PROCESSOR_BATCH_SIZE])} CSV files in {zip_key}')
+            for i in range(0, len(members), PROCESSOR_BATCH_SIZE)
+        ]
         
-        return {
-            'success': True,
-            'processed_files': json.loads(result['body'])['processed_files'],
-            'message': json.loads(result['body'])['message']
-        }
+        return invoke_processor_batches(events, crawler_name)
     except Exception as e:
         return {
             'success': False,
             'error': str(e),
-            'message': 'Failed to process CSV files'
+            'message': f'Failed to process CSV files in {zip_key}'
         }
 
-def process_existing_files(s3_client, glue_client, crawler_name, trigger_crawler):
+def list_result_file_shards(s3_client):
+    """List the per-zip folders under result_files/ so they can be listed concurrently."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    page_iterator = paginator.paginate(
+        Bucket=SOURCE_BUCKET,
+        Prefix=RESULT_FILES_PREFIX,
+        Delimiter='/'
+    )
+    
+    shards = []
+    has_top_level_files = False
+    for page in page_iterator:
+        shards.extend(prefix['Prefix'] for prefix in page.get('CommonPrefixes', []))
+        has_top_level_files = has_top_level_files or bool(page.get('Contents'))
+    
+    return shards, has_top_level_files
+
+def _process_existing_shard(s3_client, prefix, delimiter=None, crawler_name=None):
+    """List CSV files under a prefix, handing each page to the processor as soon as it arrives."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pagination_args = {'Bucket': SOURCE_BUCKET, 'Prefix': prefix, 'PaginationConfig': {'PageSize': 1000}}
+    if delimiter:
+        pagination_args['Delimiter'] = delimiter
+    
+    file_count = 0
+    process_results = []
+    for page in paginator.paginate(**pagination_args):
+        page_files = [
+            obj['Key'] for obj in page.get('Contents', [])
+            if obj['Key'].lower().endswith(('.csv', '.csv.gz'))
+        ]
+        if page_files:
+            file_count += len(page_files)
+            process_results.append(process_citibike_files(page_files, crawler_name))
+    
+    return file_count, process_results
+
+def process_existing_files(s3_client, glue_client, crawler_name, trigger_crawler, crawler_config_status=None):
     """Process existing files in the result_files/ prefix without downloading new data."""
     try:
-        # List all CSV files in the result_files/ prefix
-        files_to_process = []
-        
-        paginator = s3_client.get_paginator('list_objects_v2')
-        page_iterator = paginator.paginate(
-            Bucket=SOURCE_BUCKET,
-            Prefix=RESULT_FILES_PREFIX
-        )
+        # Shard the listing by the per-zip folders and list them in parallel
+        shards, has_top_level_files = list_result_file_shards(s3_client)
+        shard_args = [(prefix, None) for prefix in shards]
+        if has_top_level_files:
+            # Files directly under result_files/ (not in a per-zip folder)
+            shard_args.append((RESULT_FILES_PREFIX, '/'))
         
-        for page in page_iterator:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    key = obj['Key']
-                    if key.lower().endswith(('.csv', '.csv.gz')):
-                        files_to_process.append(key)
+        file_count = 0
+        process_results = []
+        processor_crawler_name = get_processor_crawler_name(trigger_crawler, crawler_name)
+        if shard_args:
+            with ThreadPoolExecutor(max_workers=min(len(shard_args), LIST_WORKERS)) as executor:
+                futures = [
+                    executor.submit(_process_existing_shard, s3_client, prefix, delimiter, processor_crawler_name)
+                    for prefix, delimiter in shard_args
+                ]
+                for future in as_completed(futures):
+                    shard_file_count, shard_results = future.result()
+                    file_count += shard_file_count
+                    process_results.extend(shard_results)
         
-        if not files_to_process:
+        if not file_count:
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'message': 'No existing CSV files found to process',
-                    'files': []
+                    'files': [],
+                    'crawler_config': crawler_config_status
                 })
             }
         
-        # Process the files
-        import process_citibike_data_lambda
-        
-        event = {
-            'files_to_process': files_to_process
-        }
-        
-        result = process_citibike_data_lambda.lambda_handler(event, None)
-        
         # Trigger Glue crawler if requested
         crawler_status = None
         if trigger_crawler:
-            crawler_status = trigger_glue_crawler(glue_client, crawler_name)
+            crawler_status = trigger_crawler_after_processing(glue_client, crawler_name)
         
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'message': f'Processed {len(files_to_process)} existing files',
-                'processed_files': json.loads(result['body'])['processed_files'],
+                'message': f'Processed {file_count} existing files',
+                'process': process_results,
+                'crawler_config': crawler_config_status,
                 'crawler': crawler_status
             })
         }
@@ -321,57 +647,175 @@ def process_existing_files(s3_client, glue_client, crawler_name, trigger_crawler
             })
         }
 
-def cleanup_files(zip_key):
-    """Clean up by moving processed zip files to an archive location or deleting them."""
-    s3_client = boto3.client('s3')
-    
-    try:
-        # Option 1: Move to archive folder
-        archive_key = f"archive/{zip_key}"
-        
-        # Copy to archive location
-        s3_client.copy_object(
+def cleanup_files_batch(zip_keys):
+    """Clean up by moving processed zip files to an archive location in as few S3 calls as possible."""
+    def archive_file(zip_key):
+        archive_key = f"{ARCHIVE_PREFIX}{zip_key}"
+        S3_CLIENT.copy_object(
             Bucket=SOURCE_BUCKET,
             CopySource={'Bucket': SOURCE_BUCKET, 'Key': zip_key},
             Key=archive_key
         )
+        return archive_key
+    
+    archived = {}
+    failed = {}
+    
+    # Copies cannot be batched, so run them concurrently
+    with ThreadPoolExecutor(max_workers=max(1, min(len(zip_keys), MAX_WORKERS))) as executor:
+        futures = {executor.submit(archive_file, zip_key): zip_key for zip_key in zip_keys}
+        for future in as_completed(futures):
+            zip_key = futures[future]
+            try:
+                archived[zip_key] = future.result()
+            except Exception as e:
+                failed[zip_key] = str(e)
+    
+    # Only delete originals that were archived; delete_objects takes up to 1000 keys per call
+    copied_keys = list(archived)
+    for i in range(0, len(copied_keys), 1000):
+        batch = copied_keys[i:i + 1000]
+        try:
+            response = S3_CLIENT.delete_objects(
+                Bucket=SOURCE_BUCKET,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+            for error in response.get('Errors', []):
+                failed[error['Key']] = error.get('Message', error.get('Code'))
+        except Exception as e:
+            for key in batch:
+                failed[key] = str(e)
+    
+    archive_locations = {key: location for key, location in archived.items() if key not in failed}
+    
+    return {
+        'success': not failed,
+        'message': f'Moved {len(archive_locations)} of {len(zip_keys)} zip files to archive location',
+        'archive_locations': archive_locations,
+        'errors': failed
+    }
+
+def configure_crawler_event_mode(glue_client, crawler_name, queue_arn):
+    """
+    Switch the Glue crawler to incremental, event-driven crawling of processed_data/.
+    
+    The SQS queue must receive the bucket's s3:ObjectCreated notifications for the
+    processed_data/ prefix; the crawler then only inspects the objects listed there.
+    
+    Does nothing if the crawler is already in event mode on that queue, so running
+    it on every invocation only costs a get_crawler call. The crawler's other targets
+    (and the processed_data/ target's own settings) are kept as they are.
+    """
+    try:
+        crawler = glue_client.get_crawler(Name=crawler_name)['Crawler']
+        target_path = f's3://{DESTINATION_BUCKET}/{PROCESSED_DATA_PREFIX}'
+        # update_crawler replaces every target, so start from the current ones
+        targets = copy.deepcopy(crawler.get('Targets', {}))
+        s3_targets = targets.setdefault('S3Targets', [])
+        processed_target = next(
+            (target for target in s3_targets if target.get('Path', '').rstrip('/') == target_path.rstrip('/')),
+            None
+        )
         
-        # Delete original
-        s3_client.delete_object(
-            Bucket=SOURCE_BUCKET,
-            Key=zip_key
+        already_configured = (
+            crawler.get('RecrawlPolicy', {}).get('RecrawlBehavior') == 'CRAWL_EVENT_MODE'
+            and processed_target is not None
+            and processed_target.get('EventQueueArn') == queue_arn
         )
+        if already_configured:
+            return {
+                'success': True,
+                'message': f'Crawler {crawler_name} already in event mode with queue {queue_arn}'
+            }
+        
+        if processed_target is None:
+            s3_targets.append({'Path': target_path, 'EventQueueArn': queue_arn})
+        else:
+            processed_target['EventQueueArn'] = queue_arn
         
+        glue_client.update_crawler(
+            Name=crawler_name,
+            Targets=targets,
+            RecrawlPolicy={'RecrawlBehavior': 'CRAWL_EVENT_MODE'},
+            # Event mode crawlers cannot delete tables/partitions, only log removals
+            SchemaChangePolicy={
+                'UpdateBehavior': 'UPDATE_IN_DATABASE',
+                'DeleteBehavior': 'LOG'
+            }
+        )
         return {
             'success': True,
-            'message': f'Successfully moved {zip_key} to archive location',
-            'archive_location': archive_key
+            'message': f'Configured crawler {crawler_name} for event mode with queue {queue_arn}'
         }
-        
-        # Option 2: Delete directly (uncomment to use this option instead)
-        # s3_client.delete_object(
-        #     Bucket=SOURCE_BUCKET,
-        #     Key=zip_key
-        # )
-        # 
-        # return {
-        #     'success': True,
-        #     'message': f'Successfully deleted {zip_key}'
-        # }
-        
     except Exception as e:
         return {
             'success': False,
             'error': str(e),
-            'message': f'Failed to clean up {zip_key}'
+            'message': f'Failed to configure crawler {crawler_name} for event mode'
         }
 
+def get_crawler_event_queue_depth(crawler):
+    """Return the number of pending S3 events for an event mode crawler, or None if it crawls everything."""
+    if crawler.get('RecrawlPolicy', {}).get('RecrawlBehavior') != 'CRAWL_EVENT_MODE':
+        return None
+    
+    queue_arns = [
+        target['EventQueueArn']
+        for target in crawler.get('Targets', {}).get('S3Targets', [])
+        if target.get('EventQueueArn')
+    ]
+    if not queue_arns:
+        return None
+    
+    depth = 0
+    for queue_arn in queue_arns:
+        # arn:aws:sqs:<region>:<account-id>:<queue-name>
+        _, _, _, _, account_id, queue_name = queue_arn.split(':')
+        queue_url = SQS_CLIENT.get_queue_url(
+            QueueName=queue_name,
+            QueueOwnerAWSAccountId=account_id
+        )['QueueUrl']
+        attributes = SQS_CLIENT.get_queue_attributes(
+            QueueUrl=queue_url,
+            AttributeNames=['ApproximateNumberOfMessages']
+        )['Attributes']
+        depth += int(attributes['ApproximateNumberOfMessages'])
+    
+    return depth
+
+def get_processor_crawler_name(trigger_crawler, crawler_name):
+    """Return the crawler the processor invocations should start, if the crawl is handed off to them."""
+    # An asynchronous processor writes its Parquet files after the orchestrator has
+    # returned, so only the processor knows when there is something new to crawl
+    if trigger_crawler and PROCESSOR_INVOCATION_TYPE != 'RequestResponse':
+        return crawler_name
+    return None
+
+def trigger_crawler_after_processing(glue_client, crawler_name):
+    """Start the crawler now if processing has finished, otherwise report the hand-off to the processor."""
+    if PROCESSOR_INVOCATION_TYPE != 'RequestResponse':
+        return {
+            'success': True,
+            'deferred': True,
+            'message': f'Crawler {crawler_name} is started by each {PROCESSOR_FUNCTION_NAME} invocation once its Parquet files are written'
+        }
+    
+    return trigger_glue_crawler(glue_client, crawler_name)
+
 def trigger_glue_crawler(glue_client, crawler_name):
     """Trigger an AWS Glue crawler to update the data catalog."""
     try:
         # Check if crawler is ready to run
         response = glue_client.get_crawler(Name=crawler_name)
         
+        # Event mode crawlers only need to run when new objects have been queued
+        queue_depth = get_crawler_event_queue_depth(response['Crawler'])
+        if queue_depth == 0:
+            return {
+                'success': True,
+                'message': f'No new objects queued for crawler {crawler_name}, skipped crawl'
+            }
+        
         if response['Crawler']['State'] == 'READY':
             # Start the crawler
             glue_client.start_crawler(Name=crawler_name)
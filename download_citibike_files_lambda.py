@@ -1,27 +1,18 @@
-import urllib.request
-import boto3
-from botocore.exceptions import ClientError
+import logging
 
-REMOTE_URL = 'https://s3.amazonaws.com/tripdata/2021-citibike-tripdata.zip'
-LOCAL_FILE_NAME = '2021-citibike-tripdata.zip'
-BUCKET_NAME = 'citibike-trips-data-1'
+from citibike_etl_orchestrator_lambda import download_citibike_file
 
-# only /tmp/ is writable in Lambda
-LOCAL_FILE_PATH = '/tmp/' + LOCAL_FILE_NAME
+REMOTE_URL = 'https://s3.amazonaws.com/tripdata/2021-citibike-tripdata.zip'
 
 
 def lambda_handler(event, context):
-    urllib.request.urlretrieve(REMOTE_URL, LOCAL_FILE_PATH)
-    
-    file_name = LOCAL_FILE_PATH    # the name of the input file
-    object_name = LOCAL_FILE_NAME  # the name of the object in S3
-    bucket = BUCKET_NAME           # the bucket you want to upload the file to
-    
-    # Upload the file
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.upload_file(file_name, bucket, object_name)
-    except ClientError as e:
-        logging.error(e)
+    # Ad-hoc single file download. The orchestrator's downloader streams the file
+    # straight into a multipart S3 upload (in parallel byte ranges for large files),
+    # so nothing is written to /tmp.
+    url = (event or {}).get('url', REMOTE_URL)
+
+    result = download_citibike_file(url)
+    if not result['success']:
+        logging.error(result['error'])
         return False
     return True
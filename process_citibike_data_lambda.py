@@ -1,90 +1,523 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import csv as pacsv
+import csv
+import copy
 import io
+import gc
+import gzip
 import json
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from s3_range_reader import open_s3_object
+from zip_member_filter import is_selected_csv_member
+
 # S3 bucket configuration
 SOURCE_BUCKET = 'citibike-trips-data-1'
 DESTINATION_BUCKET = 'citibike-trips-data-1'  # Can be same or different bucket
 SCHEMA_KEY = 'schema/citibike_columns_schema.json'
 PROCESSED_DATA_PREFIX = 'processed_data/'
+# Each invocation appends the schema changes it made as one object under this prefix;
+# compaction folds them into SCHEMA_KEY
+SCHEMA_DELTAS_PREFIX = 'schema/deltas/'
+# Every invocation lists the deltas, so once this many are pending the invocation
+# that notices compacts them (an explicit compact_schema event still works too)
+SCHEMA_COMPACT_THRESHOLD = int(os.environ.get('SCHEMA_COMPACT_THRESHOLD', '100'))
+# Bytes parsed per chunk when streaming CSV files (Arrow parses each block on multiple threads)
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+# Optional S3 Select projection: comma-separated normalized column names (e.g.
+# "start_time,stop_time,start_station_id"). When set, CSV files are filtered on the S3
+# side and only these columns are downloaded; empty keeps every column.
+SELECT_COLUMNS = [col.strip() for col in os.environ.get('SELECT_COLUMNS', '').split(',') if col.strip()]
+# Bytes fetched from the start of a file to read its header row
+CSV_HEADER_RANGE_SIZE = 64 * 1024
+# Files converted concurrently, so one file's download overlaps another's parsing
+# (each in-flight file holds a parse block and its Parquet output in memory)
+FILE_WORKERS = int(os.environ.get('FILE_WORKERS', '2'))
+# Parquet output uses columnar compression so the Glue crawler and Athena scan fewer bytes
+PARQUET_COMPRESSION = os.environ.get('PARQUET_COMPRESSION', 'zstd')
+PARQUET_COMPRESSION_LEVEL = int(os.environ.get('PARQUET_COMPRESSION_LEVEL', '3'))
+PARQUET_DATA_PAGE_SIZE = 1024 * 1024
+PARQUET_ROW_GROUP_SIZE = 128 * 1024
+# Parquet output kept in memory up to this size before spilling to /tmp
+PARQUET_SPOOL_SIZE = 64 * 1024 * 1024
+# Large Parquet files are uploaded as parallel multipart uploads
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+
+# Known column name variations, mapped to standardized names
+NYC_COLUMN_MAPPING = {
+    'tripduration': 'trip_duration',
+    'starttime': 'start_time',
+    'stoptime': 'stop_time',
+    'start_station_name': 'start_station_name',
+    'end_station_name': 'end_station_name',
+    'start_station_id': 'start_station_id',
+    'end_station_id': 'end_station_id',
+    'start_lat': 'start_latitude',
+    'start_lng': 'start_longitude',
+    'end_lat': 'end_latitude',
+    'end_lng': 'end_longitude',
+    'bikeid': 'bike_id',
+    'usertype': 'user_type',
+    'birth_year': 'birth_year',
+    'gender': 'gender',
+    'member_casual': 'member_type',
+    'rideable_type': 'rideable_type',
+    'started_at': 'start_time',
+    'ended_at': 'stop_time',
+    'start_station_latitude': 'start_latitude',
+    'start_station_longitude': 'start_longitude',
+    'end_station_latitude': 'end_latitude',
+    'end_station_longitude': 'end_longitude',
+    'station_id': 'start_station_id',
+    'name': 'start_station_name'
+}
+# Jersey City specific mappings if different from NYC
+# Most should be the same but we can add here if needed
+JC_COLUMN_MAPPING = {
+    **NYC_COLUMN_MAPPING
+}
+REGION_COLUMN_MAPPINGS = {
+    'nyc': NYC_COLUMN_MAPPING,
+    'jc': JC_COLUMN_MAPPING
+}
+
+# Region labels used as the region partition value
+REGION_NAMES = {'nyc': 'new_york', 'jc': 'jersey_city'}
+# Processed files are laid out as Hive-style partitions,
+# processed_data/region=new_york/year=2021/month=01/..., so Glue/Athena can prune by
+# region and date. Partition columns come from the path, so they are not stored in the files.
+PARTITION_COLUMNS = ('region',)
+# Partition value used when a file name has no year or month (Hive's null partition)
+DEFAULT_PARTITION_VALUE = '__HIVE_DEFAULT_PARTITION__'
+
+# Parquet types pinned for the standardized columns; other columns keep their inferred type.
+# Repetitive strings are dictionary encoded and coordinates fit comfortably in float32.
+STATION_NAME_TYPE = pa.dictionary(pa.int32(), pa.string())
+PARQUET_COLUMN_TYPES = {
+    'start_time': pa.timestamp('us'),
+    'stop_time': pa.timestamp('us'),
+    'start_station_name': STATION_NAME_TYPE,
+    'end_station_name': STATION_NAME_TYPE,
+    # Station IDs are numeric in some eras and alphanumeric in others ('HB101', 'JC115'),
+    # so they are always strings to keep one type across the crawled table
+    'start_station_id': STATION_NAME_TYPE,
+    'end_station_id': STATION_NAME_TYPE,
+    'start_latitude': pa.float32(),
+    'start_longitude': pa.float32(),
+    'end_latitude': pa.float32(),
+    'end_longitude': pa.float32(),
+    'rideable_type': pa.dictionary(pa.int32(), pa.string()),
+    'member_type': pa.dictionary(pa.int32(), pa.string()),
+    'user_type': pa.dictionary(pa.int32(), pa.string()),
+    'data_source': pa.dictionary(pa.int32(), pa.string())
+}
+
+# Citibike file names: [JC-]YYYY[MM]-citibike-tripdata..., e.g. JC-202101-citibike-tripdata.csv.zip
+FILENAME_PATTERN = re.compile(r'(?:(?P<jc>JC)-)?(?P<year>20\d{2})(?P<month>\d{2})?')
+
+STATION_ID_COLUMNS = ('start_station_id', 'end_station_id')
+# Prefix on some older Jersey City station IDs ('JC-115' or 'JC115')
+JC_STATION_ID_PREFIX = re.compile(r'^JC-?')
+
+# Trip time columns (after normalization) and the formats tried when parsing them.
+# Current files use '%Y-%m-%d %H:%M:%S' (optionally with fractional seconds, which ISO8601 covers);
+# 'mixed' is the slow per-value fallback for older files such as '1/1/2015 0:01'.
+TIME_COLUMNS = ('start_time', 'stop_time')
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', 'ISO8601', 'mixed')
+
+# Columns whose types Arrow infers while parsing; everything else is read as strings,
+# since Arrow fixes column types from the first block and IDs like station IDs change
+# format part way through some files (e.g. numeric IDs followed by 'JC115')
+INFERRED_CSV_COLUMNS = TIME_COLUMNS + (
+    'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude', 'trip_duration'
+)
+
+# Known Citibike CSV layouts, keyed by a column only that layout has, with the Arrow types
+# to parse their (standardized) columns as, so nothing is inferred and numbers arrive narrow.
+# Station IDs stay strings in both (numeric IDs mix with values like 'JC115' or 'NULL');
+# trip times are left to inference since older files use several date formats.
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+CSV_LAYOUT_TYPES = {
+    # 2021 onwards: ride_id,rideable_type,started_at,ended_at,...,member_casual
+    'ride_id': {
+        'ride_id': pa.string(),
+        'rideable_type': CATEGORY_TYPE,
+        'start_station_name': pa.string(),
+        'start_station_id': pa.string(),
+        'end_station_name': pa.string(),
+        'end_station_id': pa.string(),
+        'start_latitude': pa.float32(),
+        'start_longitude': pa.float32(),
+        'end_latitude': pa.float32(),
+        'end_longitude': pa.float32(),
+        'member_type': CATEGORY_TYPE
+    },
+    # Up to early 2021: tripduration,starttime,stoptime,start station id,...,gender
+    'trip_duration': {
+        'trip_duration': pa.int32(),
+        'start_station_id': pa.string(),
+        'start_station_name': pa.string(),
+        'start_latitude': pa.float32(),
+        'start_longitude': pa.float32(),
+        'end_station_id': pa.string(),
+        'end_station_name': pa.string(),
+        'end_latitude': pa.float32(),
+        'end_longitude': pa.float32(),
+        'bike_id': pa.int32(),
+        'user_type': CATEGORY_TYPE,
+        'birth_year': pa.string(),  # Missing values are written as '\N' in some years
+        'gender': pa.int8()
+    }
+}
+
+# Numeric columns that fit in narrower types than the pandas defaults (float64/int64).
+# Integers use the nullable pandas types so missing values don't change the dtype.
+DOWNCAST_COLUMN_TYPES = {
+    'start_latitude': 'float32',
+    'start_longitude': 'float32',
+    'end_latitude': 'float32',
+    'end_longitude': 'float32',
+    'trip_duration': 'Int32',
+    'birth_year': 'Int16',
+    'gender': 'Int8'
+}
+
+# Low-cardinality string columns kept as pandas categoricals
+CATEGORY_COLUMNS = ('user_type', 'member_type', 'rideable_type', 'data_source')
+
+# Warm containers keep the last schema document read from S3 ({'etag': ..., 'schema': ...}),
+# revalidated against the ETag, and the schema deltas read so far, keyed by S3 key
+# (deltas are never modified once written)
+_SCHEMA_CACHE = {'etag': None, 'schema': None}
+_SCHEMA_DELTA_CACHE = {}
+
+# Created once per container and reused across warm invocations, retrying
+# transient S3 errors with adaptive backoff
+S3_CLIENT = boto3.client('s3', config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+GLUE_CLIENT = boto3.client('glue')
 
 def lambda_handler(event, context):
     """
     Lambda function to process Citibike trip data files, extract columns dynamically,
     and maintain a growing schema dictionary as new columns are discovered.
     
-    This function expects to be triggered after unzip_citibike_files_lambda.py has run
-    and placed CSV files in the result_files/ prefix.
+    Accepted events:
+    - {'zip_files_to_process': [...], 'zip_members': [...]}: convert the CSV members of
+      zips in S3 in place, without staging them (the orchestrator's default; zip_members
+      is optional and selects members by full name or basename)
+    - S3 notification 'Records': convert the CSV files that were just created
+    - {'files_to_process': [...]}: convert these staged CSV keys
+    - {'compact_schema': True}: only fold the pending schema deltas into the schema
+    - anything else: convert the unprocessed CSV files under result_files/
+    Conversion events may carry 'crawler_name' to start that crawler when done.
     """
-    s3_client = boto3.client('s3')
+    # A scheduled run can fold the pending schema deltas back into the main schema
+    # document (processors also do this once SCHEMA_COMPACT_THRESHOLD are pending)
+    if event.get('compact_schema'):
+        result = compact_schema(S3_CLIENT)
+        return {
+            'statusCode': 200 if result['success'] else 500,
+            'body': json.dumps(result)
+        }
     
     # First, try to load existing schema from S3
-    schema_dict = load_existing_schema(s3_client)
+    schema_dict = load_existing_schema(S3_CLIENT)
+    
+    # Zip archives can be converted directly, reading their CSV members in place
+    zip_files_to_process = event.get('zip_files_to_process', [])
+    zip_members = event.get('zip_members')  # Optionally only convert these members
     
     # Get list of files to process from the event or scan the bucket
+    if zip_files_to_process:
+        files_to_process = []
     # If this Lambda is triggered by S3 events when new files are added:
-    if 'Records' in event and event['Records'][0]['eventSource'] == 'aws:s3':
+    elif 'Records' in event and event['Records'][0]['eventSource'] == 'aws:s3':
         files_to_process = extract_files_from_event(event)
     elif 'files_to_process' in event:
         # If files are explicitly specified in the event
         files_to_process = event['files_to_process']
     else:
         # Otherwise, scan the bucket for files with the result_files/ prefix
-        files_to_process = list_unprocessed_files(s3_client)
+        files_to_process = list_unprocessed_files(S3_CLIENT)
     
-    processed_files = []
-    for file_key in files_to_process:
-        # Process each file
-        print(f"Processing file: {file_key}")
-        
-        # Extract metadata from filename for organization
-        file_metadata = extract_metadata_from_filename(file_key)
-        
-        # Process the file and update schema
+    # Process the files, collecting each file's schema delta
+    processed_files, file_deltas = process_files(
+        [(file_key, lambda file_key=file_key: read_file_chunks(S3_CLIENT, SOURCE_BUCKET, file_key))
+         for file_key in files_to_process],
+        schema_dict,
+        S3_CLIENT
+    )
+    
+    for zip_key in zip_files_to_process:
         try:
-            df = read_file_to_dataframe(s3_client, SOURCE_BUCKET, file_key)
-            
-            if df is not None and not df.empty:
-                # Update the schema dictionary with new columns
-                schema_dict = update_schema_with_new_columns(schema_dict, df, file_metadata)
-                
-                # Process and transform the data if needed (example: standardize column names)
-                df = transform_data(df, schema_dict, file_metadata)
-                
-                # Save processed data to destination bucket with appropriate path
-                destination_key = generate_destination_key(file_key, file_metadata)
-                save_dataframe_to_s3(df, s3_client, DESTINATION_BUCKET, destination_key)
-                
-                processed_files.append({
-                    "file": file_key,
-                    "destination": destination_key,
-                    "rows": len(df),
-                    "columns": len(df.columns)
-                })
-            else:
-                print(f"File {file_key} is empty or could not be read")
+            zip_processed_files, zip_deltas = process_zip_file(S3_CLIENT, zip_key, schema_dict, zip_members)
+            processed_files.extend(zip_processed_files)
+            file_deltas.extend(zip_deltas)
         except Exception as e:
-            print(f"Error processing file {file_key}: {str(e)}")
+            print(f"Error processing zip file {zip_key}: {str(e)}")
+    
+    # After processing all files, fold the file deltas into the schema once and append
+    # only this invocation's changes (concurrent runs no longer overwrite each other)
+    updated_schema = merge_schema_deltas(copy.deepcopy(schema_dict), file_deltas)
+    delta = schema_delta(schema_dict, updated_schema)
+    if delta:
+        save_schema_delta(delta, S3_CLIENT)
     
-    # After processing all files, save the updated schema back to S3
-    save_schema_to_s3(schema_dict, s3_client)
+    # The delta cache mirrors the listing load_existing_schema just did
+    pending_deltas = len(_SCHEMA_DELTA_CACHE) + (1 if delta else 0)
+    if pending_deltas >= SCHEMA_COMPACT_THRESHOLD:
+        print(f"Compacting {pending_deltas} pending schema deltas")
+        print(compact_schema(S3_CLIENT)['message'])
+    
+    # An asynchronous orchestrator hands the crawl off to the processor, since only
+    # now do this batch's Parquet files exist
+    crawler_status = None
+    crawler_name = event.get('crawler_name')
+    if crawler_name and processed_files:
+        crawler_status = start_glue_crawler(GLUE_CLIENT, crawler_name)
+        print(crawler_status['message'])
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Processed {len(processed_files)} files',
-            'processed_files': processed_files
+            'processed_files': processed_files,
+            'crawler': crawler_status
         })
     }
 
+def process_files(files, schema_dict, s3_client):
+    """
+    Convert (file_key, read_chunks) pairs on a thread pool.
+    
+    read_chunks opens the file and returns its chunk iterator (or None), so each worker
+    downloads and parses its own file while the others are parsing or uploading.
+    Workers only read schema_dict; returns the file summaries and the files' schema deltas.
+    """
+    def process_file(file_key, read_chunks):
+        print(f"Processing file: {file_key}")
+        try:
+            chunks = read_chunks()
+            
+            file_delta, processed_file = None, None
+            if chunks is not None:
+                file_delta, processed_file = process_chunks(chunks, file_key, schema_dict, s3_client)
+            
+            if not processed_file:
+                print(f"File {file_key} is empty or could not be read")
+            return file_delta, processed_file
+        except Exception as e:
+            print(f"Error processing file {file_key}: {str(e)}")
+            return None, None
+        finally:
+            # Free this file's buffers before the worker picks up the next one so memory stays flat
+            gc.collect()
+    
+    processed_files = []
+    schema_deltas = []
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+        futures = [executor.submit(process_file, file_key, read_chunks) for file_key, read_chunks in files]
+        for future in as_completed(futures):
+            file_delta, processed_file = future.result()
+            if file_delta:
+                schema_deltas.append(file_delta)
+            if processed_file:
+                processed_files.append(processed_file)
+    
+    return processed_files, schema_deltas
+
+def process_chunks(chunks, file_key, schema_dict, s3_client):
+    """
+    Transform and write a file to S3 as Parquet, one chunk at a time.
+    
+    Each DataFrame chunk is transformed and appended to a ParquetWriter as it is read,
+    so only one chunk (plus the compressed Parquet output) is in memory at once.
+    Returns the file's schema delta and a summary of the file, or (None, None) if it had no rows.
+    """
+    # Extract metadata from filename for organization
+    file_metadata = extract_metadata_from_filename(file_key)
+    destination_key = generate_destination_key(file_key, file_metadata)
+    
+    # The Parquet output stays in memory while small and spills to /tmp once it grows
+    # past PARQUET_SPOOL_SIZE, so large files don't hold their whole output in RAM
+    parquet_buffer = tempfile.SpooledTemporaryFile(max_size=PARQUET_SPOOL_SIZE)
+    try:
+        writer = None
+        file_delta = None
+        rows = 0
+        
+        try:
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                
+                if writer is None:
+                    # Every chunk has the same columns, so the schema only needs the first one
+                    file_delta = collect_schema_delta(chunk, file_metadata)
+                
+                # Process and transform the data if needed (example: standardize column names)
+                chunk = transform_data(chunk, schema_dict, file_metadata)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                # Partition columns are encoded in the destination key instead
+                table = table.drop_columns([col for col in PARTITION_COLUMNS if col in table.column_names])
+                
+                if writer is None:
+                    # The first chunk fixes the file schema
+                    writer = pq.ParquetWriter(
+                        parquet_buffer,
+                        build_parquet_schema(table.schema),
+                        compression=PARQUET_COMPRESSION,
+                        compression_level=PARQUET_COMPRESSION_LEVEL if pa.Codec.supports_compression_level(PARQUET_COMPRESSION) else None,
+                        use_dictionary=True,
+                        data_page_size=PARQUET_DATA_PAGE_SIZE
+                    )
+                
+                # Later chunks may infer different (but compatible) pandas dtypes
+                writer.write_table(table.cast(writer.schema), row_group_size=PARQUET_ROW_GROUP_SIZE)
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        if writer is None:
+            return None, None
+        
+        # Save processed data to destination bucket with appropriate path
+        destination_key = upload_parquet_to_s3(parquet_buffer, s3_client, DESTINATION_BUCKET, destination_key)
+        
+        return file_delta, {
+            "file": file_key,
+            "destination": destination_key,
+            "rows": rows,
+            "columns": len(writer.schema)
+        }
+    finally:
+        parquet_buffer.close()
+
+def build_parquet_schema(inferred_schema):
+    """Build the Parquet schema for a file from the first chunk's inferred Arrow schema."""
+    fields = []
+    for field in inferred_schema:
+        if field.name in PARQUET_COLUMN_TYPES:
+            field = field.with_type(PARQUET_COLUMN_TYPES[field.name])
+        elif pa.types.is_null(field.type):
+            # Columns that are all empty in the first chunk default to strings
+            field = field.with_type(pa.string())
+        fields.append(field)
+    
+    return pa.schema(fields, metadata=inferred_schema.metadata)
+
+def process_zip_file(s3_client, zip_key, schema_dict, members=None):
+    """
+    Convert the CSV members of a zip archive in S3 directly to Parquet.
+    
+    Each member is parsed straight from the archive, so no intermediate CSV
+    copies are written to (and read back from) the result_files/ prefix.
+    If members is given, only those members are converted, and only their bytes
+    are fetched from S3. Returns the file summaries and the members' schema deltas.
+    """
+    zip_basename = os.path.basename(zip_key).replace('.zip', '')
+    
+    with zipfile.ZipFile(open_s3_object(s3_client, SOURCE_BUCKET, zip_key)) as z:
+        filenames = [
+            filename for filename in z.namelist()
+            if is_selected_csv_member(filename, members)
+        ]
+    
+    # Name each member as it would have been staged under result_files/
+    return process_files(
+        [(f"{zip_basename}/{filename}",
+          lambda filename=filename: read_zip_member_chunks(s3_client, zip_key, filename))
+         for filename in filenames],
+        schema_dict,
+        s3_client
+    )
+
+def read_zip_member_chunks(s3_client, zip_key, filename):
+    """Read a CSV member of a zip archive in S3 as an iterator of DataFrame chunks."""
+    # ZipFile shares one file position across members, so every member
+    # gets its own reader and members can be parsed concurrently
+    with zipfile.ZipFile(open_s3_object(s3_client, SOURCE_BUCKET, zip_key)) as z:
+        with z.open(filename) as member:
+            yield from read_csv_chunks(member, filename)
+
+class SelectPayloadReader(io.RawIOBase):
+    """Read-only file object over the Records payloads of an S3 Select event stream."""
+    
+    def __init__(self, event_stream):
+        self.records = (event['Records']['Payload'] for event in event_stream if 'Records' in event)
+        self.pending = b''
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while not self.pending:
+            payload = next(self.records, None)
+            if payload is None:
+                return 0
+            self.pending = payload
+        
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
 def load_existing_schema(s3_client):
-    """Load existing schema dictionary from S3 if it exists, otherwise return empty dict."""
+    """Load the schema from S3 (main document plus pending deltas), or an empty schema."""
+    schema_dict, _ = load_schema_document(s3_client)
+    
+    delta_keys = list_schema_deltas(s3_client)
+    for delta_key in delta_keys:
+        apply_schema_delta(schema_dict, load_schema_delta(s3_client, delta_key))
+    
+    # Forget deltas that have since been compacted away
+    for delta_key in _SCHEMA_DELTA_CACHE.keys() - set(delta_keys):
+        del _SCHEMA_DELTA_CACHE[delta_key]
+    
+    return schema_dict
+
+def load_schema_document(s3_client):
+    """
+    Load the main schema document and its ETag from S3; an empty schema (and None) if it doesn't exist.
+    
+    The document is only downloaded and parsed when its ETag differs from the cached copy.
+    Callers get their own copy, since the schema is updated in place while processing.
+    """
     try:
-        response = s3_client.get_object(Bucket=DESTINATION_BUCKET, Key=SCHEMA_KEY)
+        request = {'Bucket': DESTINATION_BUCKET, 'Key': SCHEMA_KEY}
+        if _SCHEMA_CACHE['etag']:
+            request['IfNoneMatch'] = _SCHEMA_CACHE['etag']
+        
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304:
+                # Not modified since it was cached
+                return copy.deepcopy(_SCHEMA_CACHE['schema']), _SCHEMA_CACHE['etag']
+            raise
+        
         schema_dict = json.loads(response['Body'].read().decode('utf-8'))
-        return schema_dict
+        _SCHEMA_CACHE.update(etag=response['ETag'], schema=schema_dict)
+        return copy.deepcopy(schema_dict), response['ETag']
     except Exception as e:
         print(f"No existing schema found or error loading schema: {str(e)}")
         # Initialize with empty dictionary
@@ -93,7 +526,72 @@ def load_existing_schema(s3_client):
             'column_mappings': {},  # Maps alternate column names to standardized names
             'sources': {},  # Tracks which columns appear in which data sources
             'last_updated': datetime.now().isoformat()
-        }
+        }, None
+
+def list_schema_deltas(s3_client):
+    """List the pending schema delta keys, oldest first."""
+    delta_keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DESTINATION_BUCKET, Prefix=SCHEMA_DELTAS_PREFIX):
+        delta_keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    
+    # Delta keys start with their creation time, so key order is creation order
+    return sorted(delta_keys)
+
+def load_schema_delta(s3_client, delta_key):
+    """Load one schema delta from S3 (deltas are immutable, so each is only read once per container)."""
+    if delta_key not in _SCHEMA_DELTA_CACHE:
+        response = s3_client.get_object(Bucket=DESTINATION_BUCKET, Key=delta_key)
+        _SCHEMA_DELTA_CACHE[delta_key] = json.loads(response['Body'].read().decode('utf-8'))
+    return _SCHEMA_DELTA_CACHE[delta_key]
+
+def schema_delta(previous, schema_dict):
+    """Return the columns, mappings and source columns schema_dict added to previous, or None."""
+    previous_sources = previous.get('sources', {})
+    delta = {
+        'columns': {
+            name: info for name, info in schema_dict.get('columns', {}).items()
+            if name not in previous.get('columns', {})
+        },
+        'column_mappings': {
+            name: normalized for name, normalized in schema_dict.get('column_mappings', {}).items()
+            if name not in previous.get('column_mappings', {})
+        },
+        'sources': {}
+    }
+    
+    for source_key, source in schema_dict.get('sources', {}).items():
+        known_columns = set(previous_sources.get(source_key, {}).get('columns', []))
+        new_columns = [name for name in source['columns'] if name not in known_columns]
+        if new_columns or source_key not in previous_sources:
+            delta['sources'][source_key] = {**source, 'columns': new_columns}
+    
+    if not any(delta.values()):
+        return None
+    
+    delta['last_updated'] = schema_dict.get('last_updated')
+    return delta
+
+def apply_schema_delta(schema_dict, delta):
+    """Fold a schema delta into schema_dict in place (earlier deltas win for column details)."""
+    columns = schema_dict.setdefault('columns', {})
+    for name, info in delta.get('columns', {}).items():
+        columns.setdefault(name, info)
+    
+    column_mappings = schema_dict.setdefault('column_mappings', {})
+    for name, normalized in delta.get('column_mappings', {}).items():
+        column_mappings.setdefault(name, normalized)
+    
+    sources = schema_dict.setdefault('sources', {})
+    for source_key, source in delta.get('sources', {}).items():
+        source_columns = sources.setdefault(source_key, {**source, 'columns': []})['columns']
+        known_columns = set(source_columns)
+        source_columns.extend(name for name in source['columns'] if name not in known_columns)
+    
+    if delta.get('last_updated'):
+        schema_dict['last_updated'] = max(schema_dict.get('last_updated') or '', delta['last_updated'])
+    
+    return schema_dict
 
 def extract_files_from_event(event):
     """Extract file keys from S3 event notification."""
@@ -128,41 +626,135 @@ def list_unprocessed_files(s3_client):
     
     return files
 
-def read_file_to_dataframe(s3_client, bucket, key):
-    """Read a CSV file from S3 into a pandas DataFrame."""
+def read_file_chunks(s3_client, bucket, key):
+    """Read a CSV file from S3 as an iterator of pandas DataFrame chunks."""
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        
-        # Determine file type by extension
-        file_ext = os.path.splitext(key.lower())[-1]
-        
-        if file_ext == '.csv' or key.lower().endswith('.csv.zip'):
-            # Handle both uncompressed and gzipped CSV files
-            if key.endswith('.gz'):
-                df = pd.read_csv(io.BytesIO(response['Body'].read()), compression='gzip', 
-                                low_memory=False, error_bad_lines=False, warn_bad_lines=True)
-            else:
-                df = pd.read_csv(io.BytesIO(response['Body'].read()), 
-                                low_memory=False, error_bad_lines=False, warn_bad_lines=True)
-        elif file_ext in ['.xlsx', '.xls']:
-            # Handle Excel files
-            import pandas as pd
-            df = pd.read_excel(io.BytesIO(response['Body'].read()))
-        else:
+        # Only CSVs are produced upstream (plain or gzipped)
+        if not key.lower().endswith(('.csv', '.csv.zip', '.csv.gz')):
             print(f"Unsupported file type for {key}")
             return None
         
-        # Basic data cleaning
-        # 1. Strip whitespace from column names
-        df.columns = df.columns.str.strip()
+        if SELECT_COLUMNS and key.lower().endswith(('.csv', '.csv.gz')):
+            # Let S3 Select drop the unused columns before they leave S3
+            chunks = read_selected_csv_chunks(s3_client, bucket, key, SELECT_COLUMNS)
+            if chunks is not None:
+                return chunks
         
-        return df
+        # Parse straight from the streaming body rather than buffering the whole object
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        return read_csv_chunks(response['Body'], key)
     except Exception as e:
         print(f"Error reading file {key}: {str(e)}")
         return None
 
-def update_schema_with_new_columns(schema_dict, df, file_metadata):
-    """Update schema dictionary with any new columns found in the dataframe."""
+def skip_invalid_row(row):
+    """Arrow CSV handler for malformed rows: warn and skip, like pandas on_bad_lines='warn'."""
+    print(f"Skipping malformed CSV row {row.number}: {row.text[:200]}")
+    return 'skip'
+
+def parse_csv_header(data):
+    """Return the column names from the first line of CSV bytes, or None if the line is incomplete."""
+    header = data.split(b'\n', 1)
+    if len(header) < 2:
+        return None
+    return next(csv.reader([header[0].decode('utf-8-sig')]))
+
+def csv_column_types(columns):
+    """Pick Arrow types for the CSV columns: the known layout's types, else string unless inferred."""
+    # Same standardization as transform_data, e.g. 'Start Station Latitude' -> 'start_latitude'
+    standardized = {col: normalize_column_name(col.strip().lower()) for col in columns or []}
+    
+    # Recognize the layout (era) from the header
+    layout_types = next(
+        (types for marker, types in CSV_LAYOUT_TYPES.items() if marker in standardized.values()),
+        {}
+    )
+    
+    column_types = {}
+    for col, name in standardized.items():
+        if name in layout_types:
+            column_types[col] = layout_types[name]
+        elif name not in INFERRED_CSV_COLUMNS:
+            column_types[col] = pa.string()
+    return column_types
+
+def parse_csv_chunks(fileobj, column_types, column_names=None):
+    """Parse a buffered CSV stream block by block into DataFrame chunks."""
+    # Arrow's multi-threaded parser overlaps parsing with the download and
+    # never holds the whole file in memory at once
+    reader = pacsv.open_csv(
+        fileobj,
+        read_options=pacsv.ReadOptions(
+            use_threads=True,
+            block_size=CSV_BLOCK_SIZE,
+            column_names=column_names
+        ),
+        parse_options=pacsv.ParseOptions(invalid_row_handler=skip_invalid_row),
+        convert_options=pacsv.ConvertOptions(column_types=column_types)
+    )
+    for batch in reader:
+        chunk = pa.Table.from_batches([batch]).to_pandas(split_blocks=True, self_destruct=True)
+        # Basic data cleaning
+        # 1. Normalize column names once here (stripped, lower case) for all later steps
+        chunk.columns = chunk.columns.str.strip().str.lower()
+        yield chunk
+
+def read_selected_csv_chunks(s3_client, bucket, key, select_columns):
+    """
+    Read only select_columns (normalized names) of a CSV file on S3 through S3 Select.
+    Returns None when the header can't be read or none of the columns are present.
+    """
+    # Read the header from the first bytes of the file to find the raw column names
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{CSV_HEADER_RANGE_SIZE - 1}')
+    data = response['Body'].read()
+    if key.lower().endswith('.gz'):
+        # A prefix of a gzip stream decompresses fine on its own
+        data = zlib.decompressobj(wbits=31).decompress(data)
+    header = parse_csv_header(data)
+    if header is None:
+        return None
+    
+    # Same standardization as transform_data, so spaced pre-2021 names match too
+    columns = [col for col in header if normalize_column_name(col.strip().lower()) in select_columns]
+    if not columns:
+        return None
+    
+    projection = ', '.join('s."{}"'.format(col.replace('"', '""')) for col in columns)
+    response = s3_client.select_object_content(
+        Bucket=bucket,
+        Key=key,
+        ExpressionType='SQL',
+        Expression=f"SELECT {projection} FROM s3object s",
+        InputSerialization={
+            'CSV': {'FileHeaderInfo': 'USE'},
+            'CompressionType': 'GZIP' if key.lower().endswith('.gz') else 'NONE'
+        },
+        OutputSerialization={'CSV': {}}
+    )
+    
+    # The result has no header row, so the column names come from the projection
+    fileobj = io.BufferedReader(SelectPayloadReader(response['Payload']), buffer_size=CSV_BLOCK_SIZE)
+    return parse_csv_chunks(fileobj, csv_column_types(columns), column_names=columns)
+
+def read_csv_chunks(fileobj, key):
+    """Read a CSV file object (from S3 or a zip member) as an iterator of DataFrame chunks."""
+    # Handle both uncompressed and gzipped CSV files
+    if key.endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    fileobj = io.BufferedReader(fileobj, buffer_size=CSV_BLOCK_SIZE)
+    
+    # Peek at the header so the column types can be pinned before parsing starts
+    # (without a complete header line buffered, Arrow infers every column)
+    column_types = csv_column_types(parse_csv_header(fileobj.peek(CSV_BLOCK_SIZE)))
+    return parse_csv_chunks(fileobj, column_types)
+
+def collect_schema_delta(df, file_metadata):
+    """
+    Describe the columns of a dataframe as a schema delta, without touching the schema.
+    
+    Files are converted concurrently, so each one only collects its delta and the
+    handler merges them into the schema once (merge_schema_deltas).
+    """
     year = file_metadata.get('year')
     month = file_metadata.get('month')
     region = file_metadata.get('region', 'nyc')
@@ -175,47 +767,41 @@ def update_schema_with_new_columns(schema_dict, df, file_metadata):
     if month:
         source_key += f"_{month}"
     
-    # Ensure source entry exists
-    if 'sources' not in schema_dict:
-        schema_dict['sources'] = {}
+    # Get column info for all columns at once (names are already normalized at ingest)
+    data_types = dict(zip(df.columns, df.dtypes.astype(str)))
+    normalized_names = {name: normalize_column_name(name, region) for name in data_types}
     
-    if source_key not in schema_dict['sources']:
-        schema_dict['sources'][source_key] = {
-            'year': year,
-            'month': month,
-            'region': region,
-            'columns': []
-        }
-    
-    # Get column info
-    for column in df.columns:
-        column_name = column.strip().lower()  # Normalize column names
-        data_type = str(df[column].dtype)
-        
-        # Record the column for this source
-        if column_name not in schema_dict['sources'][source_key]['columns']:
-            schema_dict['sources'][source_key]['columns'].append(column_name)
-        
-        # Add new column to the columns dictionary if it doesn't exist
-        if column_name not in schema_dict['columns']:
-            normalized_name = normalize_column_name(column_name, region)
-            
-            schema_dict['columns'][column_name] = {
+    return {
+        'columns': {
+            name: {
                 'data_type': data_type,
                 'first_seen_year': year,
                 'first_seen_month': month,
                 'first_seen_region': region,
-                'normalized_name': normalized_name
+                'normalized_name': normalized_names[name]
             }
-            
-            # Also add to column mappings for consistency
-            if 'column_mappings' not in schema_dict:
-                schema_dict['column_mappings'] = {}
-                
-            schema_dict['column_mappings'][column_name] = normalized_name
+            for name, data_type in data_types.items()
+        },
+        # Also add to column mappings for consistency
+        'column_mappings': normalized_names,
+        'sources': {
+            source_key: {
+                'year': year,
+                'month': month,
+                'region': region,
+                'columns': list(data_types)
+            }
+        }
+    }
+
+def merge_schema_deltas(schema_dict, deltas):
+    """Fold the collected file deltas into schema_dict; columns already known keep their details."""
+    for delta in deltas:
+        apply_schema_delta(schema_dict, delta)
     
-    # Update timestamp
-    schema_dict['last_updated'] = datetime.now().isoformat()
+    # Update timestamp once for the whole batch
+    if deltas:
+        schema_dict['last_updated'] = datetime.now().isoformat()
     
     return schema_dict
 
@@ -230,81 +816,9 @@ def normalize_column_name(column_name, region='nyc'):
     # Replace spaces with underscores
     normalized = column_name.replace(' ', '_')
     
-    # Handle variations based on region and known column mappings
-    nyc_mapping = {
-        'tripduration': 'trip_duration',
-        'starttime': 'start_time',
-        'stoptime': 'stop_time',
-        'start_station_name': 'start_station_name',
-        'end_station_name': 'end_station_name',
-        'start_station_id': 'start_station_id',
-        'end_station_id': 'end_station_id',
-        'start_lat': 'start_latitude',
-        'start_lng': 'start_longitude',
-        'end_lat': 'end_latitude',
-        'end_lng': 'end_longitude',
-        'bikeid': 'bike_id',
-        'usertype': 'user_type',
-        'birth_year': 'birth_year',
-        'gender': 'gender',
-        'member_casual': 'member_type',
-        'rideable_type': 'rideable_type',
-        'started_at': 'start_time',
-        'ended_at': 'stop_time',
-        'start_station_latitude': 'start_latitude',
-        'start_station_longitude': 'start_longitude',
-        'end_station_latitude': 'end_latitude',
-        'end_station_longitude': 'end_longitude',
-        'start_lat': 'start_latitude',
-        'start_lng': 'start_longitude',
-        'end_lat': 'end_latitude',
-        'end_lng': 'end_longitude',
-        'station_id': 'start_station_id',
-        'name': 'start_station_name'
-    }
-    
-    jc_mapping = {
-        # Jersey City specific mappings if different from NYC
-        # Most should be the same but we can add here if needed
-        'tripduration': 'trip_duration',
-        'starttime': 'start_time',
-        'stoptime': 'stop_time',
-        'start_station_name': 'start_station_name',
-        'end_station_name': 'end_station_name',
-        'start_station_id': 'start_station_id',
-        'end_station_id': 'end_station_id',
-        'start_lat': 'start_latitude',
-        'start_lng': 'start_longitude',
-        'end_lat': 'end_latitude',
-        'end_lng': 'end_longitude',
-        'bikeid': 'bike_id',
-        'usertype': 'user_type',
-        'birth_year': 'birth_year',
-        'gender': 'gender',
-        'member_casual': 'member_type',
-        'rideable_type': 'rideable_type',
-        'started_at': 'start_time',
-        'ended_at': 'stop_time',
-        'start_station_latitude': 'start_latitude',
-        'start_station_longitude': 'start_longitude',
-        'end_station_latitude': 'end_latitude',
-        'end_station_longitude': 'end_longitude',
-        'start_lat': 'start_latitude',
-        'start_lng': 'start_longitude',
-        'end_lat': 'end_latitude',
-        'end_lng': 'end_longitude',
-        'station_id': 'start_station_id',
-        'name': 'start_station_name'        
-    }
-    
-    # Apply specific mappings based on region
-    mapping = nyc_mapping if region == 'nyc' else jc_mapping
-    
-    # Apply specific mappings if they exist
-    if normalized in mapping:
-        return mapping[normalized]
-    
-    return normalized
+    # Apply specific mappings based on region, if they exist
+    mapping = REGION_COLUMN_MAPPINGS.get(region, JC_COLUMN_MAPPING)
+    return mapping.get(normalized, normalized)
 
 def transform_data(df, schema_dict, file_metadata):
     """
@@ -315,14 +829,13 @@ def transform_data(df, schema_dict, file_metadata):
     region = file_metadata.get('region', 'nyc')
     
     # Create a mapping of current column names to normalized column names
-    column_mapping = {}
-    for col in df.columns:
-        col_lower = col.strip().lower()
-        if col_lower in schema_dict.get('column_mappings', {}):
-            column_mapping[col] = schema_dict['column_mappings'][col_lower]
-        else:
-            # If no mapping exists, use the normalized version of the current name
-            column_mapping[col] = normalize_column_name(col_lower, region)
+    # (names are already stripped and lower-cased at ingest). If no mapping
+    # exists, use the normalized version of the current name.
+    known_mappings = schema_dict.get('column_mappings', {})
+    column_mapping = {
+        col: known_mappings.get(col) or normalize_column_name(col, region)
+        for col in df.columns
+    }
     
     # Rename the columns
     df = df.rename(columns=column_mapping)
@@ -332,62 +845,76 @@ def transform_data(df, schema_dict, file_metadata):
         # Jersey City specific transformations
         
         # 1. Fix station IDs in older JC data (some used different formats)
-        if 'start_station_id' in df.columns and df['start_station_id'].dtype == 'object':
-            # Some JC data has station IDs with 'JC' prefix
-            df['start_station_id'] = df['start_station_id'].astype(str).str.replace('JC-', '').str.replace('JC', '')
-            # Try to convert to numeric but keep as string if it fails
-            try:
-                df['start_station_id'] = pd.to_numeric(df['start_station_id'])
-            except:
-                pass
-                
-        if 'end_station_id' in df.columns and df['end_station_id'].dtype == 'object':
-            df['end_station_id'] = df['end_station_id'].astype(str).str.replace('JC-', '').str.replace('JC', '')
-            try:
-                df['end_station_id'] = pd.to_numeric(df['end_station_id'])
-            except:
-                pass
+        for id_column in STATION_ID_COLUMNS:
+            if id_column in df.columns:
+                # Some JC data has station IDs with 'JC' prefix. IDs stay strings: a file is
+                # written chunk by chunk with the first chunk's types, and a numeric guess for
+                # one chunk breaks on a later chunk with IDs like 'HB101'
+                df[id_column] = df[id_column].astype('string').str.replace(JC_STATION_ID_PREFIX, '', regex=True)
         
         # 2. Add region identifier to station names for clarity when combined with NYC data
-        if 'start_station_name' in df.columns:
-            # Only add prefix if it's not already there
-            mask = ~df['start_station_name'].astype(str).str.startswith('JC - ')
-            df.loc[mask, 'start_station_name'] = 'JC - ' + df.loc[mask, 'start_station_name'].astype(str)
-            
-        if 'end_station_name' in df.columns:
-            mask = ~df['end_station_name'].astype(str).str.startswith('JC - ')
-            df.loc[mask, 'end_station_name'] = 'JC - ' + df.loc[mask, 'end_station_name'].astype(str)
+        for name_column in ('start_station_name', 'end_station_name'):
+            if name_column in df.columns:
+                # Only add prefix if it's not already there (missing names stay missing)
+                station_names = df[name_column].astype('string')
+                df[name_column] = station_names.where(
+                    station_names.str.startswith('JC - ', na=True),
+                    'JC - ' + station_names
+                )
         
-        # 3. Add region column for easier filtering
-        df['region'] = 'jersey_city'
+        # 3. Add region column (process_chunks drops it again: the region= partition
+        # in the destination key carries it)
+        df['region'] = REGION_NAMES['jc']
     else:
         # NYC specific transformations
         
-        # Add region column for easier filtering
-        df['region'] = 'new_york'
+        # Add region column (dropped again in favour of the region= partition)
+        df['region'] = REGION_NAMES['nyc']
     
     # Handle data type conversions (applies to both regions)
-    for col in df.columns:
-        # Convert datetime columns
-        if any(time_keyword in col.lower() for time_keyword in ['time', 'date', 'started_at', 'ended_at']):
-            try:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-            except:
-                pass  # If conversion fails, keep as is
+    for col in TIME_COLUMNS:
+        if col in df.columns:
+            df[col] = parse_datetime_column(df[col])
+    
+    # Station IDs are always written as strings (see PARQUET_COLUMN_TYPES)
+    for col in STATION_ID_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('string')
     
     # Add a source column to track data origin
     df['data_source'] = f"{region}_{file_metadata.get('year', 'unknown')}"
     if file_metadata.get('month'):
         df['data_source'] += f"_{file_metadata.get('month')}"
     
+    # Downcast numeric columns. Every chunk of a file must end up with the same dtype
+    # (the first chunk fixes the Parquet schema), so values that aren't numbers
+    # (e.g. '\N' birth years) become missing instead of leaving the column as strings
+    for col, dtype in DOWNCAST_COLUMN_TYPES.items():
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
     return df
 
-def save_dataframe_to_s3(df, s3_client, bucket, key):
-    """Save a dataframe to S3 as a Parquet file for better performance with Glue."""
-    # Convert to Parquet format for better compatibility with AWS Glue
-    parquet_buffer = io.BytesIO()
-    df.to_parquet(parquet_buffer)
+def parse_datetime_column(values):
+    """Parse a trip time column with the first known format that fits every value."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
     
+    for datetime_format in DATETIME_FORMATS[:-1]:
+        try:
+            return pd.to_datetime(values, format=datetime_format, errors='raise', cache=True)
+        except (ValueError, TypeError):
+            continue
+    
+    # Last resort: per-value inference, unparseable values become NaT
+    return pd.to_datetime(values, format=DATETIME_FORMATS[-1], errors='coerce', cache=True)
+
+def upload_parquet_to_s3(parquet_buffer, s3_client, bucket, key):
+    """Upload a finished Parquet file buffer to S3."""
     # Move buffer position to the beginning
     parquet_buffer.seek(0)
     
@@ -396,19 +923,94 @@ def save_dataframe_to_s3(df, s3_client, bucket, key):
         key = key.rsplit('.', 1)[0] + '.parquet'
     
     # Upload to S3
-    s3_client.upload_fileobj(parquet_buffer, bucket, key)
+    s3_client.upload_fileobj(parquet_buffer, bucket, key, Config=TRANSFER_CONFIG)
     
     return key
 
-def save_schema_to_s3(schema_dict, s3_client):
-    """Save the updated schema dictionary back to S3."""
-    schema_json = json.dumps(schema_dict, indent=2)
+def save_schema_to_s3(schema_dict, s3_client, etag=None):
+    """
+    Save the schema dictionary back to S3.
+    
+    The write is conditional: it only replaces the document with the given ETag
+    (or, with no ETag, only creates it), so a concurrent compaction isn't overwritten.
+    """
+    schema_json = json.dumps(schema_dict, separators=(',', ':'))
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
     s3_client.put_object(
         Body=schema_json,
         Bucket=DESTINATION_BUCKET,
         Key=SCHEMA_KEY,
+        ContentType='application/json',
+        **condition
+    )
+
+def save_schema_delta(delta, s3_client):
+    """Append a schema delta as its own object under the deltas prefix."""
+    # Time-ordered, unique key so concurrent invocations never collide
+    delta_key = f"{SCHEMA_DELTAS_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex}.json"
+    s3_client.put_object(
+        Body=json.dumps(delta, separators=(',', ':')),
+        Bucket=DESTINATION_BUCKET,
+        Key=delta_key,
         ContentType='application/json'
     )
+    return delta_key
+
+def compact_schema(s3_client):
+    """Fold the pending schema deltas into the main schema document and delete them."""
+    try:
+        schema_dict, etag = load_schema_document(s3_client)
+        delta_keys = list_schema_deltas(s3_client)
+        if not delta_keys:
+            return {'success': True, 'message': 'No schema deltas to compact'}
+        
+        for delta_key in delta_keys:
+            apply_schema_delta(schema_dict, load_schema_delta(s3_client, delta_key))
+        
+        try:
+            save_schema_to_s3(schema_dict, s3_client, etag)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                # Another compaction replaced the document first; its deltas are folded next time
+                return {'success': True, 'message': 'Schema changed during compaction, skipped'}
+            raise
+        
+        # Only the folded deltas are removed; ones written meanwhile stay pending
+        for i in range(0, len(delta_keys), 1000):
+            s3_client.delete_objects(
+                Bucket=DESTINATION_BUCKET,
+                Delete={'Objects': [{'Key': key} for key in delta_keys[i:i + 1000]], 'Quiet': True}
+            )
+        
+        return {'success': True, 'message': f'Compacted {len(delta_keys)} schema deltas'}
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'message': 'Failed to compact schema'
+        }
+
+def start_glue_crawler(glue_client, crawler_name):
+    """Start the Glue crawler after this invocation's Parquet files have been written."""
+    try:
+        glue_client.start_crawler(Name=crawler_name)
+        return {
+            'success': True,
+            'message': f'Started crawler {crawler_name}'
+        }
+    except glue_client.exceptions.CrawlerRunningException:
+        # Another batch started it first; files written after that crawl began are
+        # catalogued by the next one (event mode crawlers keep them queued)
+        return {
+            'success': False,
+            'message': f'Crawler {crawler_name} is already running, new files are catalogued by its next run'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'message': f'Failed to start crawler {crawler_name}'
+        }
 
 def extract_metadata_from_filename(filename):
     """
@@ -419,8 +1021,6 @@ def extract_metadata_from_filename(filename):
     - 202101-citibike-tripdata.csv.zip → {'year': '2021', 'month': '01', 'region': 'nyc', 'type': 'monthly'}
     - JC-202101-citibike-tripdata.csv.zip → {'year': '2021', 'month': '01', 'region': 'jc', 'type': 'monthly'}
     """
-    import re
-    
     metadata = {
         'year': None,
         'month': None,
@@ -428,62 +1028,33 @@ def extract_metadata_from_filename(filename):
         'type': 'unknown'
     }
     
-    base_filename = os.path.basename(filename)
-    
-    # Check if it's Jersey City data (JC prefix)
-    if 'JC-' in base_filename:
-        metadata['region'] = 'jc'
-        base_part = base_filename.replace('JC-', '')
-    else:
-        base_part = base_filename
-    
-    # Try to extract year and month
-    # Annual pattern: 2021-citibike-tripdata.zip
-    annual_match = re.search(r'^(20\d{2})-citibike-tripdata', base_part)
-    if annual_match:
-        metadata['year'] = annual_match.group(1)
-        metadata['type'] = 'annual'
-        return metadata
-    
-    # Monthly pattern: 202101-citibike-tripdata.csv.zip
-    monthly_match = re.search(r'^(20\d{2})(\d{2})-citibike-tripdata', base_part)
-    if monthly_match:
-        metadata['year'] = monthly_match.group(1)
-        metadata['month'] = monthly_match.group(2)
-        metadata['type'] = 'monthly'
-        return metadata
-    
-    # If we can't parse the pattern but can find a year, use that
-    year_match = re.search(r'(20\d{2})', base_part)
-    if year_match:
-        metadata['year'] = year_match.group(1)
-        # Look for a month after identifying the year
-        month_match = re.search(r'(20\d{2})(\d{2})', base_part)
-        if month_match:
-            metadata['month'] = month_match.group(2)
-            metadata['type'] = 'monthly'
-        else:
-            metadata['type'] = 'annual'
+    # Annual files carry only a year, monthly files a year and month
+    match = FILENAME_PATTERN.search(os.path.basename(filename))
+    if match:
+        metadata['region'] = 'jc' if match['jc'] else 'nyc'
+        metadata['year'] = match['year']
+        metadata['month'] = match['month']
+        metadata['type'] = 'monthly' if match['month'] else 'annual'
     
     return metadata
 
 def generate_destination_key(file_key, file_metadata):
     """Generate the destination key for processed data with appropriate organization."""
-    year = file_metadata.get('year', 'unknown')
-    month = file_metadata.get('month')
+    year = file_metadata.get('year') or DEFAULT_PARTITION_VALUE
+    month = file_metadata.get('month') or DEFAULT_PARTITION_VALUE
     region = file_metadata.get('region', 'nyc')
     
     # Base filename without path and extension
     filename = os.path.basename(file_key)
     base_name = filename.split('.')[0]
     
-    # Build the destination path
-    if month:
-        # Monthly data: processed_data/nyc/2021/01/202101-citibike-tripdata.parquet
-        # or: processed_data/jc/2021/01/JC-202101-citibike-tripdata.parquet
-        destination_key = f"{PROCESSED_DATA_PREFIX}{region}/{year}/{month}/{base_name}.parquet"
-    else:
-        # Annual data: processed_data/nyc/2021/2021-citibike-tripdata.parquet
-        destination_key = f"{PROCESSED_DATA_PREFIX}{region}/{year}/{base_name}.parquet"
+    # Build the destination path, for example
+    # processed_data/region=new_york/year=2021/month=01/202101-citibike-tripdata.parquet
+    # or: processed_data/region=jersey_city/year=2021/month=01/JC-202101-citibike-tripdata.parquet
+    # Every file gets all three partition levels so the crawler sees one consistent table
+    destination_key = (
+        f"{PROCESSED_DATA_PREFIX}region={REGION_NAMES.get(region, region)}/"
+        f"year={year}/month={month}/{base_name}.parquet"
+    )
     
     return destination_key
\ No newline at end of file
@@ -0,0 +1,80 @@
+import io
+
+# Zip archives are read in place on S3 through ranged GETs of this size
+ZIP_READ_BUFFER_SIZE = 8 * 1024 * 1024
+# The end of central directory record and the central directory live in the zip's tail
+ZIP_TAIL_SIZE = 64 * 1024
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over an S3 object that fetches bytes with ranged GETs.
+    
+    The last tail_size bytes are fetched up front (which also gives the object size), so
+    opening a zip reads its central directory with a single request and only the
+    members that are actually opened are downloaded.
+    """
+    
+    def __init__(self, s3_client, bucket, key, tail_size=ZIP_TAIL_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=-{tail_size}')
+        self.tail = response['Body'].read()
+        if 'ContentRange' in response:
+            # Format: bytes <start>-<end>/<size>
+            self.size = int(response['ContentRange'].rsplit('/', 1)[1])
+        else:
+            self.size = len(self.tail)
+        self.tail_start = self.size - len(self.tail)
+        self.position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f'Invalid whence: {whence}')
+        
+        self.position = max(0, position)
+        return self.position
+    
+    def readinto(self, buffer):
+        if self.position >= self.size or len(buffer) == 0:
+            return 0
+        
+        if self.position >= self.tail_start:
+            # Served from the prefetched tail without another request
+            offset = self.position - self.tail_start
+            data = self.tail[offset:offset + len(buffer)]
+            buffer[:len(data)] = data
+            self.position += len(data)
+            return len(data)
+        
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f'bytes={self.position}-{end}'
+        )
+        data = response['Body'].read()
+        
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def open_s3_object(s3_client, bucket, key):
+    """Open an S3 object as a buffered, seekable file backed by ranged GETs."""
+    return io.BufferedReader(S3RangeReader(s3_client, bucket, key), buffer_size=ZIP_READ_BUFFER_SIZE)
@@ -1,29 +1,45 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+import os
 import zipfile
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from s3_range_reader import open_s3_object
 
 BUCKET = 'citibike-trips-data-1'
 FILE_TO_UNZIP = '2023-citibike-tripdata.zip'
 
+# Each member is streamed to S3 as a multipart upload in 8 MB parts, one part at a
+# time: the parallelism comes from UNZIP_WORKERS uploading members side by side
+TRANSFER_CONFIG = TransferConfig(multipart_chunksize=8 * 1024 * 1024, max_concurrency=1)
+# Members are uploaded concurrently; each upload is bound by S3 round trips, not CPU
+UNZIP_WORKERS = int(os.environ.get('UNZIP_WORKERS', '16'))
+# Each worker holds at most one ranged GET on the zip and one part upload at a time
+S3_CONFIG = Config(max_pool_connections=UNZIP_WORKERS * (TRANSFER_CONFIG.max_request_concurrency + 1))
+
+def upload_member(s3, filename):
+    # ZipFile shares one file position across members, so each worker
+    # opens its own reader rather than seeking a shared one
+    with zipfile.ZipFile(open_s3_object(s3, BUCKET, FILE_TO_UNZIP)) as z:
+        with z.open(filename) as member:
+            s3.upload_fileobj(
+                member,
+                Bucket=BUCKET,
+                Key='result_files/' + f'{filename}',
+                Config=TRANSFER_CONFIG)
+
 def lambda_handler(event, context):
-    s3 = boto3.client('s3')
-    s3_resource = boto3.resource('s3')
-    
-    # Create the zip_obj variable which contains a reference to the file
-    # in S3 that we will unzip.
-    zip_obj = s3_resource.Object(bucket_name=BUCKET, key=FILE_TO_UNZIP)
-    print (zip_obj)
+    s3 = boto3.client('s3', config=S3_CONFIG)
     
-    # Load a reference to the contents of the zipped file in S3 into
-    # a ZipFile object built from a BytesIO buffer.
-    buffer = BytesIO(zip_obj.get()["Body"].read())
-    z = zipfile.ZipFile(buffer)
+    # Open the zipped file in S3 as a seekable file backed by ranged GETs.
+    # zipfile only reads the central directory and the bytes of each member,
+    # so the archive is never loaded into memory as a whole.
+    with zipfile.ZipFile(open_s3_object(s3, BUCKET, FILE_TO_UNZIP)) as z:
+        filenames = z.namelist()
     
-    # Iterate through each file inside the zipped file.
-    # Unzip and store those files in the same bucket in results_files/
-    for filename in z.namelist():
-        file_info = z.getinfo(filename)
-        s3_resource.meta.client.upload_fileobj(
-            z.open(filename),
-            Bucket=BUCKET,
-            Key='result_files/' + f'{filename}')
+    # Unzip and store each file in the same bucket in results_files/
+    with ThreadPoolExecutor(max_workers=UNZIP_WORKERS) as executor:
+        futures = [executor.submit(upload_member, s3, filename) for filename in filenames]
+        for future in futures:
+            future.result()
@@ -0,0 +1,12 @@
+import os
+
+# Citibike archives only ship CSV files; the suffix is matched case-insensitively
+CSV_SUFFIX = '.csv'
+
+def is_selected_member(filename, zip_members):
+    """Check whether a zip member was requested, by full name or basename (None selects all)."""
+    return zip_members is None or filename in zip_members or os.path.basename(filename) in zip_members
+
+def is_selected_csv_member(filename, zip_members):
+    """Check whether a zip member is a CSV file and was requested (see is_selected_member)."""
+    return filename.lower().endswith(CSV_SUFFIX) and is_selected_member(filename, zip_members)